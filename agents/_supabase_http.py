@@ -0,0 +1,175 @@
+"""
+Supabase HTTP plumbing shared by the LiveKit workers.
+Holds the JSON helpers, the per-event-loop client lifecycle and the worker-wide id generator so
+``estate_avatar.py`` and ``outbound_caller.py`` stay in step.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import secrets
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, Optional
+
+import httpx
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+logger = logging.getLogger("supabase-http")
+
+
+def env_int(name: str, default: int, minimum: int = 1) -> int:
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        value: Optional[int] = int(raw)
+    except ValueError:
+        value = None
+    if value is None or value < minimum:
+        logger.warning("Ignoring invalid %s=%r; using %d", name, raw, default)
+        return default
+    return value
+
+
+SUPA_TIMEOUT = httpx.Timeout(20.0, read=20.0)
+SUPA_RETRIES = 2
+# Longest a single Supabase call can take: every attempt may run to the timeout.
+SUPA_REQUEST_BUDGET = 20.0 * (SUPA_RETRIES + 1)
+
+# Tool calls multiplex over one connection; set SUPABASE_HTTP2=0 if the gateway misbehaves.
+_HTTP2 = os.getenv("SUPABASE_HTTP2", "1") == "1"
+# Caps in-flight Supabase requests per loop so bursts queue here instead of at the gateway.
+_MAX_INFLIGHT = env_int("SUPABASE_MAX_INFLIGHT", 32)
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def dumps_str(obj: Any) -> str:
+    """Encode ``obj`` as canonical (key-sorted) JSON for LiveKit metadata and prompt text, stringifying unknown types."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SORT_KEYS).decode()
+    return json.dumps(obj, default=str, sort_keys=True)
+
+
+def loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = bytes(data)
+    return json.loads(data)  # accepts bytes directly, no str round-trip
+
+
+def json_fragment(obj: Any, sort_keys: bool = False) -> Any:
+    """Pre-serialize ``obj`` so it can be embedded in several messages without re-encoding."""
+    if orjson is not None:
+        return orjson.Fragment(orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else None))
+    return obj
+
+
+class TTLCache:
+    """Small LRU cache whose entries expire ``ttl`` seconds after being stored."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+@dataclass(slots=True)
+class LoopResources:
+    """Supabase client, request limiter and lookup state shared by the sessions running on one event loop."""
+
+    client: Optional[httpx.AsyncClient] = None
+    semaphore: asyncio.Semaphore = field(default_factory=lambda: asyncio.Semaphore(_MAX_INFLIGHT))
+    # Read-only lookups; CRM writes are never cached.
+    query_cache: TTLCache = field(default_factory=lambda: TTLCache(maxsize=512, ttl=30.0))
+    # Identical lookups already in flight; later callers await the first request instead of re-posting.
+    inflight: Dict[Hashable, "asyncio.Task[Dict[str, Any]]"] = field(default_factory=dict)
+    sessions: int = 0
+
+
+# Jobs can share a process, and under the thread executor each runs on its own loop. Clients, tasks
+# and futures must not cross loops, so everything loop-bound is kept per loop rather than per module.
+_LOOP_RESOURCES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LoopResources]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def loop_resources() -> LoopResources:
+    loop = asyncio.get_running_loop()
+    resources = _LOOP_RESOURCES.get(loop)
+    if resources is None:
+        resources = _LOOP_RESOURCES[loop] = LoopResources()
+    return resources
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return this loop's Supabase client so tool calls reuse pooled connections."""
+    resources = loop_resources()
+    if resources.client is None or resources.client.is_closed:
+        resources.client = httpx.AsyncClient(
+            timeout=SUPA_TIMEOUT,
+            # Retries cover connect failures only; HTTP error statuses still surface through raise_for_status.
+            transport=httpx.AsyncHTTPTransport(
+                http2=_HTTP2,
+                retries=SUPA_RETRIES,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0),
+            ),
+        )
+    return resources.client
+
+
+def acquire_loop_resources() -> None:
+    loop_resources().sessions += 1
+
+
+async def release_loop_resources() -> None:
+    """Drop a session's hold; the client closes once no session on this loop still uses it."""
+    resources = loop_resources()
+    resources.sessions -= 1
+    if resources.sessions > 0:
+        return
+    client, resources.client = resources.client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+# Fallback identities only need to be unique per worker, so draw randomness once and count from there.
+_ID_PREFIX = secrets.token_hex(4)
+_ID_COUNTER = itertools.count()
+
+
+def fallback_identity_suffix() -> str:
+    return f"{_ID_PREFIX}{next(_ID_COUNTER):x}"
@@ -9,16 +9,20 @@ Realtime, and calls Supabase Edge Functions for property search and CRM actions.
 from __future__ import annotations
 
 import asyncio
+import functools
+import itertools
 import json
 import logging
 import os
 import secrets
-from dataclasses import dataclass
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Mapping, NamedTuple, Optional, TYPE_CHECKING
 
-import httpx
 from dotenv import load_dotenv
 from livekit.agents import (
     Agent,
@@ -35,6 +39,21 @@ from livekit.agents.voice.room_io import RoomInputOptions
 from livekit.plugins import google, deepgram, cartesia, silero
 from livekit.plugins.anam import avatar as anam_avatar
 
+from _supabase_http import (
+    LoopResources,
+    SUPA_REQUEST_BUDGET,
+    acquire_loop_resources,
+    dumps,
+    dumps_str,
+    env_int,
+    fallback_identity_suffix,
+    get_http_client,
+    json_fragment,
+    loads,
+    loop_resources,
+    release_loop_resources,
+)
+
 if TYPE_CHECKING:
     RunCtxParam = Optional[RunContext]
 else:
@@ -90,7 +109,90 @@ TOOL_GUIDE = r"""
 """
 
 
-@dataclass
+def _normalize_prompt_text(text: str) -> str:
+    return "\n".join(line.strip().lower() for line in text.splitlines() if line.strip())
+
+
+_TOOL_SECTION = TOOL_GUIDE.strip()
+_NORMALIZED_TOOL_GUIDE = _normalize_prompt_text(_TOOL_SECTION)
+_SESSION_CONTEXT_HEADER = "\n\n[SESSION_CONTEXT]\n"
+
+
+@functools.lru_cache(maxsize=None)
+def _envelope_prefix(message_type: str) -> bytes:
+    return b'{"type":' + dumps(message_type) + b',"payload":'
+
+
+def _encode_message(message_type: str, payload: Dict[str, Any]) -> bytes:
+    """Encode ``{"type": message_type, "payload": payload}`` reusing the cached envelope bytes."""
+    return _envelope_prefix(message_type) + dumps(payload) + b"}"
+
+
+def _normalize_activity_type(activity_type: Optional[str]) -> str:
+    kind = (activity_type or "note").strip().lower()
+    kind = _ACTIVITY_TYPE_ALIASES.get(kind, kind)
+    return kind if kind in _ACTIVITY_TYPES else "note"
+
+
+def _consume_task_result(task: asyncio.Task) -> None:
+    # Mark a failure as retrieved so a fetch whose waiters were all cancelled is not reported as unhandled.
+    if not task.cancelled():
+        task.exception()
+
+
+_OVERLAY_ACK_TTL = 120.0
+_MAX_UNACKED_OVERLAYS = 256
+
+# Transient notices tolerate loss; menus, details and lead confirmations must arrive.
+_RELIABLE_BY_KIND: Dict[str, bool] = {
+    "properties.menu": True,
+    "properties.detail": True,
+    "leads.created": True,
+    "leads.activity": False,
+    "directions.show": False,
+}
+
+# Activities logged within this window are sent to the CRM in one request.
+_ACTIVITY_FN = "estate-crm-log-activity"
+_ACTIVITY_BATCH_SIZE = 10
+_ACTIVITY_BATCH_WINDOW = 0.5
+# activities.type only accepts these values; CTA and model-chosen kinds are mapped onto them and
+# anything unrecognized is stored as a note (the message keeps the visitor-facing wording).
+_ACTIVITY_TYPES = frozenset(("note", "task", "status"))
+_ACTIVITY_TYPE_ALIASES = {
+    "tour": "task",
+    "brochure": "task",
+    "follow_up": "task",
+    "follow-up": "task",
+    "followup": "task",
+    "callback": "task",
+    "stage": "status",
+}
+
+# Only the first few matches are read back to the LLM.
+_SUMMARY_LIMIT = 5
+
+_LK_TRANSCRIPTION_TOPIC = "lk.transcription"
+_NON_FINAL_FLAGS = frozenset(("false", "False", "0", False))
+_EMPTY_ATTRS: Mapping[str, Any] = MappingProxyType({})
+
+_PROPERTY_FIELDS = (
+    "id",
+    "name",
+    "location",
+    "base_price",
+    "amenities",
+    "highlights",
+    "availability",
+    "hero_image",
+    "unit_types",
+)
+
+# How long a job waits for the visitor before giving up (and stopping the already-started avatar).
+_PARTICIPANT_WAIT_TIMEOUT = env_int("PARTICIPANT_WAIT_TIMEOUT", 120)
+
+
+@dataclass(slots=True, frozen=True)
 class AgentConfig:
     livekit_url: str
     livekit_api_key: str
@@ -110,6 +212,31 @@ class AgentConfig:
     controller_identity_prefix: str = "estate-controller"
     prompt_version: str = "v1"
     prompt_updated_at: Optional[str] = None
+    max_transcript_segments: int = 10000
+    capture_transcripts: bool = True
+    functions_base_url: str = field(init=False, repr=False)
+    auth_header: str = field(init=False, repr=False)
+    base_metadata: Mapping[str, Any] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "functions_base_url", f"{self.supabase_url.rstrip('/')}/functions/v1/")
+        object.__setattr__(self, "auth_header", f"Bearer {self.supabase_service_role_key or self.supabase_anon_key}")
+        object.__setattr__(
+            self,
+            "base_metadata",
+            MappingProxyType(
+                {
+                    "role": "agent",
+                    "agentName": self.agent_name,
+                    "agentType": "avatar",
+                    "avatarId": self.anam_avatar_id,
+                    "googleModel": self.google_model,
+                    "cartesiaVoiceId": self.cartesia_voice_id,
+                    "promptVersion": self.prompt_version,
+                    "promptUpdatedAt": self.prompt_updated_at,
+                }
+            ),
+        )
 
     @classmethod
     def from_env(cls) -> "AgentConfig":
@@ -150,6 +277,13 @@ class AgentConfig:
 
         prompt_version = (os.getenv("PROMPT_VERSION") or "v1").strip() or "v1"
         prompt_updated_at = _clean_str(os.getenv("PROMPT_UPDATED_AT"))
+        max_transcript_segments = env_int("MAX_TRANSCRIPT_SEGMENTS", 10000)
+        capture_transcripts = (os.getenv("CAPTURE_TRANSCRIPTS") or "true").strip().lower() not in {
+            "0",
+            "false",
+            "no",
+            "off",
+        }
 
         return cls(
             livekit_url=livekit_url,
@@ -170,41 +304,37 @@ class AgentConfig:
             controller_identity_prefix=os.getenv("CONTROLLER_IDENTITY_PREFIX", "estate-controller"),
             prompt_version=prompt_version,
             prompt_updated_at=prompt_updated_at,
+            max_transcript_segments=max_transcript_segments,
+            capture_transcripts=capture_transcripts,
         )
 
     def with_session_overrides(self, overrides: Dict[str, Any]) -> "AgentConfig":
         if not overrides:
             return self
 
-        def _string_override(*keys: str) -> Optional[str]:
-            for key in keys:
-                value = overrides.get(key)
-                cleaned = _clean_str(value)
-                if cleaned:
-                    return cleaned
-            return None
+        cleaned = _clean_overrides(overrides)
 
-        agent_name = _string_override("agentName") or self.agent_name
-        agent_identity_prefix = _string_override("agentIdentityPrefix") or self.agent_identity_prefix
+        agent_name = _pick(cleaned, "agentName") or self.agent_name
+        agent_identity_prefix = _pick(cleaned, "agentIdentityPrefix") or self.agent_identity_prefix
         controller_identity_prefix = (
-            _string_override("controllerIdentityPrefix") or self.controller_identity_prefix
+            _pick(cleaned, "controllerIdentityPrefix") or self.controller_identity_prefix
         )
-        model_override = _string_override("googleModel", "openaiRealtimeModel", "openaiModel", "model")
+        model_override = _pick(cleaned, "googleModel", "openaiRealtimeModel", "openaiModel", "model")
         if model_override and "gemini" not in model_override.lower():
             model_override = None  # ignore incompatible model strings
         google_model = model_override or self.google_model
 
-        voice_override = _string_override("cartesiaVoiceId", "voice", "openaiVoice", "openaiRealtimeVoice")
+        voice_override = _pick(cleaned, "cartesiaVoiceId", "voice", "openaiVoice", "openaiRealtimeVoice")
         if voice_override and "-" not in voice_override:
             voice_override = None  # avoid invalid Cartesia voices from legacy overrides
         cartesia_voice_id = voice_override or self.cartesia_voice_id
 
         anam_avatar_id = (
-            _string_override("anamAvatarId", "anam_avatar_id", "avatarId", "avatarID") or self.anam_avatar_id
+            _pick(cleaned, "anamAvatarId", "anam_avatar_id", "avatarId", "avatarID") or self.anam_avatar_id
         )
-        agent_name = _string_override("avatarName", "agentDisplayName") or agent_name
-        prompt_version = _string_override("promptVersion") or self.prompt_version
-        prompt_updated_at = _string_override("promptUpdatedAt") or self.prompt_updated_at
+        agent_name = _pick(cleaned, "avatarName", "agentDisplayName") or agent_name
+        prompt_version = _pick(cleaned, "promptVersion") or self.prompt_version
+        prompt_updated_at = _pick(cleaned, "promptUpdatedAt") or self.prompt_updated_at
 
         return AgentConfig(
             livekit_url=self.livekit_url,
@@ -225,28 +355,26 @@ class AgentConfig:
             controller_identity_prefix=controller_identity_prefix,
             prompt_version=prompt_version,
             prompt_updated_at=prompt_updated_at,
+            max_transcript_segments=self.max_transcript_segments,
+            capture_transcripts=self.capture_transcripts,
         )
 
     def agent_identity(self, job_id: Optional[str]) -> str:
-        suffix = job_id or secrets.token_hex(4)
+        suffix = job_id or fallback_identity_suffix()
         return f"{self.agent_identity_prefix}:{suffix}"
 
     def controller_identity(self, job_id: Optional[str]) -> str:
-        suffix = job_id or secrets.token_hex(4)
+        suffix = job_id or fallback_identity_suffix()
         return f"{self.controller_identity_prefix}:{suffix}"
 
     def agent_metadata(self, agent_identity: str) -> Dict[str, Any]:
-        return {
-            "role": "agent",
-            "agentIdentity": agent_identity,
-            "agentName": self.agent_name,
-            "agentType": "avatar",
-            "avatarId": self.anam_avatar_id,
-            "googleModel": self.google_model,
-            "cartesiaVoiceId": self.cartesia_voice_id,
-            "promptVersion": self.prompt_version,
-            "promptUpdatedAt": self.prompt_updated_at,
-        }
+        return {**self.base_metadata, "agentIdentity": agent_identity}
+
+
+@functools.lru_cache(maxsize=1)
+def _base_config() -> AgentConfig:
+    """Read and validate the environment once per process; dispatches and jobs layer overrides on top."""
+    return AgentConfig.from_env()
 
 
 def _clean_str(value: Any) -> Optional[str]:
@@ -256,23 +384,34 @@ def _clean_str(value: Any) -> Optional[str]:
     return None
 
 
+def _clean_overrides(overrides: Dict[str, Any]) -> Dict[str, str]:
+    """Keep only the overrides that are non-empty strings, stripped."""
+    return {key: value for key, value in ((k, _clean_str(v)) for k, v in overrides.items()) if value}
+
+
+def _pick(cleaned: Dict[str, str], *keys: str) -> Optional[str]:
+    return next((cleaned[key] for key in keys if key in cleaned), None)
+
+
 def _extract_session_overrides(raw: Optional[str]) -> Dict[str, Any]:
-    if not raw or not isinstance(raw, str):
+    if not raw or not isinstance(raw, str) or not raw.lstrip().startswith("{"):
         return {}
     try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+        data = loads(raw)
+    except json.JSONDecodeError:  # orjson.JSONDecodeError subclasses this
         logger.warning("[estate-buddy-agent] Unable to parse session metadata: %s", raw)
         return {}
 
     if not isinstance(data, dict):
         return {}
 
-    overrides: Dict[str, Any] = {}
-    for key in ("sessionOverrides", "agentConfig", "sessionConfig"):
-        value = data.get(key)
-        if isinstance(value, dict):
-            overrides.update({k: v for k, v in value.items() if v is not None})
+    overrides: Dict[str, Any] = {
+        k: v
+        for source in (data.get("sessionOverrides"), data.get("agentConfig"), data.get("sessionConfig"))
+        if isinstance(source, dict)
+        for k, v in source.items()
+        if v is not None
+    }
 
     if not overrides:
         filtered = {
@@ -285,91 +424,270 @@ def _extract_session_overrides(raw: Optional[str]) -> Dict[str, Any]:
     return overrides
 
 
-def build_agent_instructions(
-    base_prompt: str, config: AgentConfig, session_overrides: Optional[Dict[str, Any]]
-) -> str:
+@functools.lru_cache(maxsize=32)
+def _prepare_prompt_body(base_prompt: str) -> str:
     prompt_body = (base_prompt or DEFAULT_PROMPT or "").strip()
     if not prompt_body:
         prompt_body = FALLBACK_PROMPT
-    tool_section = TOOL_GUIDE.strip()
-    if tool_section:
-        normalized_body = "\n".join(line.strip().lower() for line in prompt_body.splitlines() if line.strip())
-        normalized_tools = "\n".join(
-            line.strip().lower() for line in tool_section.splitlines() if line.strip()
+    if _TOOL_SECTION and _NORMALIZED_TOOL_GUIDE not in _normalize_prompt_text(prompt_body):
+        prompt_body = f"{prompt_body.rstrip()}\n\n{_TOOL_SECTION}\n"
+    return prompt_body
+
+
+# Prepare the prompt used by every session without an override at import time.
+_prepare_prompt_body(DEFAULT_PROMPT or FALLBACK_PROMPT)
+
+
+class SessionOverrides(NamedTuple):
+    """Session overrides with the identity and prompt keys cleaned once per job."""
+
+    raw: Dict[str, Any]
+    agent_identity: Optional[str] = None
+    controller_identity: Optional[str] = None
+    agent_name: Optional[str] = None
+    visitor_name: Optional[str] = None
+    system_prompt: Optional[str] = None
+
+    @classmethod
+    def from_raw(cls, overrides: Dict[str, Any]) -> "SessionOverrides":
+        if not overrides:
+            return cls(raw=overrides)
+        cleaned = _clean_overrides(overrides)
+        return cls(
+            raw=overrides,
+            agent_identity=cleaned.get("agentIdentity"),
+            controller_identity=cleaned.get("agentControllerIdentity"),
+            agent_name=cleaned.get("agentName"),
+            visitor_name=cleaned.get("visitorName"),
+            system_prompt=_pick(cleaned, "assistantPrompt", "systemPrompt", "prompt"),
         )
-        if normalized_tools not in normalized_body:
-            prompt_body = f"{prompt_body.rstrip()}\n\n{tool_section}\n"
+
+
+@functools.lru_cache(maxsize=32)
+def _render_instructions(
+    base_prompt: str,
+    prompt_version: str,
+    prompt_updated_at: Optional[str],
+    session_meta: tuple[tuple[str, str], ...],
+) -> str:
+    # The prompt body leads so every session shares a byte-identical prefix for provider-side prompt caching;
+    # per-session markers and the session context follow it.
     meta_lines: List[str] = [
-        f"[prompt_version::{config.prompt_version}]",
+        _prepare_prompt_body(base_prompt).rstrip(),
+        f"[prompt_version::{prompt_version}]",
     ]
-    if config.prompt_updated_at:
-        meta_lines.append(f"[prompt_updated_at::{config.prompt_updated_at}]")
+    if prompt_updated_at:
+        meta_lines.append(f"[prompt_updated_at::{prompt_updated_at}]")
+    meta_lines.extend(f"[session::{key}::{val}]" for key, val in session_meta)
+    return "\n".join(meta_lines)
+
+
+def build_agent_instructions(
+    base_prompt: str, config: AgentConfig, session_overrides: Optional[Dict[str, Any]]
+) -> str:
+    session_meta: tuple[tuple[str, str], ...] = ()
     if session_overrides:
-        model_meta = _string_override("googleModel", "model", "openaiModel", "openaiRealtimeModel")
-        voice_meta = _string_override("cartesiaVoiceId", "voice", "openaiVoice", "openaiRealtimeVoice")
-        agent_name_meta = _string_override("agentName", "avatarName")
-        for key, val in (("agentName", agent_name_meta), ("googleModel", model_meta), ("cartesiaVoiceId", voice_meta)):
-            if val:
-                meta_lines.append(f"[session::{key}::{val}]")
-    metadata_header = "\n".join(meta_lines)
-    return f"{metadata_header}\n{prompt_body}"
+        cleaned = _clean_overrides(session_overrides)
+        model_meta = _pick(cleaned, "googleModel", "model", "openaiModel", "openaiRealtimeModel")
+        voice_meta = _pick(cleaned, "cartesiaVoiceId", "voice", "openaiVoice", "openaiRealtimeVoice")
+        agent_name_meta = _pick(cleaned, "agentName", "avatarName")
+        session_meta = tuple(
+            (key, val)
+            for key, val in (("agentName", agent_name_meta), ("googleModel", model_meta), ("cartesiaVoiceId", voice_meta))
+            if val
+        )
+    return _render_instructions(base_prompt, config.prompt_version, config.prompt_updated_at, session_meta)
+
+
+async def _load_session_components(config: AgentConfig) -> tuple[Any, Any, Any, Any]:
+    """Build the STT/VAD/LLM/TTS plugins; the blocking Silero model load runs in a worker thread."""
+    stt = deepgram.STT(
+        model="nova-3",
+        api_key=config.deepgram_api_key,
+        interim_results=True,
+        endpointing_ms=25,
+        no_delay=True,
+        smart_format=True,
+        punctuate=True,
+        filler_words=False,
+    )
+    llm = google.LLM(
+        model=config.google_model,
+        api_key=config.google_api_key,
+    )
+    tts = cartesia.TTS(
+        model="sonic-3",
+        voice=config.cartesia_voice_id,
+        api_key=config.cartesia_api_key,
+    )
+    vad = await asyncio.to_thread(silero.VAD.load)
+    return stt, vad, llm, tts
 
 
 class EstateTools:
     def __init__(self, config: AgentConfig, room: RunCtxParam) -> None:
         self.config = config
         self.room = room
-        self.unacked_overlays: set[str] = set()  # TODO: Phase 3 - replay if acks are missing on reconnect
+        # overlay_id -> publish time; TODO: Phase 3 - replay if acks are missing on reconnect
+        self.unacked_overlays: OrderedDict[str, float] = OrderedDict()
         self.last_overlay_id: Optional[str] = None
         self.last_menu_overlay: Optional[Dict[str, Any]] = None
         self.last_detail_overlay: Optional[Dict[str, Any]] = None
+        self._functions_url = config.functions_base_url
+        self._auth_headers = {
+            "Content-Type": "application/json",
+            "Authorization": config.auth_header,
+        }
+        self._overlay_prefix = secrets.token_hex(3)
+        self._overlay_counter = itertools.count()
+        self._bg_queue: asyncio.Queue[tuple[str, Dict[str, Any]]] = asyncio.Queue(maxsize=256)
+        self._bg_task = asyncio.create_task(self._bg_worker())
+
+    def _next_overlay_id(self, kind: str) -> str:
+        return f"{kind}-{self._overlay_prefix}-{next(self._overlay_counter):x}"
 
     def register_ack(self, overlay_id: Optional[str]) -> None:
         if overlay_id:
-            self.unacked_overlays.discard(overlay_id)
+            self.unacked_overlays.pop(overlay_id, None)
+
+    def _track_unacked(self, overlay_id: str) -> None:
+        unacked = self.unacked_overlays
+        now = time.monotonic()
+        unacked[overlay_id] = now
+        unacked.move_to_end(overlay_id)
+        while unacked and (
+            len(unacked) > _MAX_UNACKED_OVERLAYS or now - next(iter(unacked.values())) > _OVERLAY_ACK_TTL
+        ):
+            unacked.popitem(last=False)
 
     async def _call_supabase_function(self, fn_name: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.config.supabase_service_role_key or self.config.supabase_anon_key}",
-        }
-        url = f"{self.config.supabase_url.rstrip('/')}/functions/v1/{fn_name}"
-        async with httpx.AsyncClient(timeout=httpx.Timeout(20.0, read=20.0)) as client:
-            response = await client.post(url, json=payload, headers=headers)
+        async with loop_resources().semaphore:
+            response = await get_http_client().post(
+                self._functions_url + fn_name, content=dumps(payload), headers=self._auth_headers
+            )
         response.raise_for_status()
         data = response.json()
         if isinstance(data, dict):
             return data
         return {"data": data}
 
-    async def _publish_overlay(self, kind: str, payload: Dict[str, Any]) -> None:
+    async def _cached_query(self, key: Hashable, payload: Dict[str, Any]) -> Dict[str, Any]:
+        resources = loop_resources()
+        cached = resources.query_cache.get(key)
+        if cached is not None:
+            return cached
+        fetch = resources.inflight.get(key)
+        if fetch is None:
+            # The fetch runs as its own task so cancelling the caller that started it (e.g. an
+            # interrupted tool call) does not cancel the lookup for everyone coalesced onto it.
+            fetch = asyncio.create_task(self._fetch_query(resources, key, payload))
+            fetch.add_done_callback(_consume_task_result)
+            resources.inflight[key] = fetch
+        return await asyncio.shield(fetch)
+
+    async def _fetch_query(
+        self, resources: LoopResources, key: Hashable, payload: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        try:
+            result = await self._call_supabase_function("estate-db-query", payload)
+            resources.query_cache.set(key, result)
+            return result
+        finally:
+            resources.inflight.pop(key, None)
+
+    def enqueue_background_call(self, fn_name: str, payload: Dict[str, Any]) -> None:
+        """Queue a best-effort Supabase call whose response nothing waits on."""
+        try:
+            self._bg_queue.put_nowait((fn_name, payload))
+        except asyncio.QueueFull:
+            logger.warning("Background queue full; dropping %s call", fn_name)
+
+    async def _bg_worker(self) -> None:
+        pending: Optional[tuple[str, Dict[str, Any]]] = None
+        while True:
+            fn_name, payload = pending or await self._bg_queue.get()
+            pending = None
+            taken = 1
+            if fn_name == _ACTIVITY_FN:
+                activities, pending = await self._collect_activities(payload)
+                taken = len(activities)
+                if taken > 1:
+                    payload = {"activities": activities}
+            try:
+                result = await self._call_supabase_function(fn_name, payload)
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("Background call to %s failed: %s", fn_name, exc)
+            else:
+                if result.get("failures"):
+                    logger.warning("%s rejected %d row(s): %s", fn_name, len(result["failures"]), result["failures"])
+            finally:
+                for _ in range(taken):
+                    self._bg_queue.task_done()
+
+    async def _collect_activities(
+        self, first: Dict[str, Any]
+    ) -> tuple[List[Dict[str, Any]], Optional[tuple[str, Dict[str, Any]]]]:
+        """Gather activities logged in quick succession; returns them plus any other call dequeued meanwhile."""
+        activities = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + _ACTIVITY_BATCH_WINDOW
+        while len(activities) < _ACTIVITY_BATCH_SIZE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                fn_name, payload = await asyncio.wait_for(self._bg_queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if fn_name != _ACTIVITY_FN:
+                return activities, (fn_name, payload)
+            activities.append(payload)
+        return activities, None
+
+    async def aclose(self) -> None:
+        # The summary is queued during shutdown, possibly behind a batching window; give the drain
+        # room for a worst-case call so it is not cancelled mid-request.
+        drain_timeout = SUPA_REQUEST_BUDGET + _ACTIVITY_BATCH_WINDOW + 5.0
+        try:
+            await asyncio.wait_for(self._bg_queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out draining %d background call(s)", self._bg_queue.qsize())
+        self._bg_task.cancel()
+
+    async def _publish_overlay(
+        self, kind: str, payload: Dict[str, Any], encoded: Optional[Mapping[str, Any]] = None
+    ) -> None:
+        """Publish a UI overlay; ``encoded`` holds pre-serialized values used only in the outgoing message."""
         if not self.room or not getattr(self.room, "local_participant", None):
             logger.debug("Room participant not ready; skipping overlay event %s", kind)
             return
-        overlay_id = payload.get("overlayId") or f"ovr-{secrets.token_hex(4)}"
+        overlay_id = payload.get("overlayId") or self._next_overlay_id("ovr")
         payload["overlayId"] = overlay_id
-        self.unacked_overlays.add(overlay_id)
+        self._track_unacked(overlay_id)
         if kind.startswith("properties.menu"):
             self.last_menu_overlay = {"kind": kind, **payload}
         if kind.startswith("properties.detail"):
             self.last_detail_overlay = {"kind": kind, **payload}
         self.last_overlay_id = overlay_id
-        message = json.dumps(
-            {
-                "type": "ui.overlay",
-                "payload": {
-                    "kind": kind,
-                    **payload,
-                },
-            },
-        ).encode("utf-8")
-        await self.room.local_participant.publish_data(message, topic="ui.overlay", reliable=True)
+        message_payload = {"kind": kind, **payload}
+        if encoded:
+            message_payload.update(encoded)
+        message = _encode_message("ui.overlay", message_payload)
+        await self.room.local_participant.publish_data(
+            message, topic="ui.overlay", reliable=_RELIABLE_BY_KIND.get(kind, True)
+        )
 
-    async def _publish_rpc(self, topic: str, payload: Dict[str, Any]) -> None:
+    async def _publish_rpc(
+        self,
+        topic: str,
+        payload: Dict[str, Any],
+        reliable: bool = True,
+        encoded: Optional[Mapping[str, Any]] = None,
+    ) -> None:
         if not self.room or not getattr(self.room, "local_participant", None):
             return
-        message = json.dumps({"type": topic, "payload": payload}).encode("utf-8")
-        await self.room.local_participant.publish_data(message, topic=topic, reliable=True)
+        message = _encode_message(topic, {**payload, **encoded} if encoded else payload)
+        await self.room.local_participant.publish_data(message, topic=topic, reliable=reliable)
 
     @function_tool(
         name="list_properties",
@@ -384,7 +702,7 @@ class EstateTools:
         overlay_id: Optional[str] = None,
         context_property_id: Optional[str] = None,
     ) -> str:
-        overlay_id = overlay_id or f"ovr-{secrets.token_hex(4)}"
+        overlay_id = overlay_id or self._next_overlay_id("ovr")
         payload = {
             "query": query or "",
             "filters": {
@@ -395,64 +713,64 @@ class EstateTools:
             "context_property_id": context_property_id,
             "overlay_id": overlay_id,
         }
-        result = await self._call_supabase_function("estate-db-query", payload)
+        cache_key = ("list", query or "", location or "", max_budget, bedrooms, context_property_id)
+        result = await self._cached_query(cache_key, payload)
         properties = result.get("properties") or result.get("results") or result.get("data") or []
 
-        cards = []
+        cards: List[Optional[Dict[str, Any]]] = [None] * len(properties)
         summaries = []
-        for prop in properties:
-            price_value = prop.get("base_price")
+        for index, prop in enumerate(properties):
+            (
+                prop_id,
+                name,
+                prop_location,
+                price_value,
+                amenities,
+                highlights,
+                availability,
+                hero_image,
+                unit_types,
+            ) = map(prop.get, _PROPERTY_FIELDS)
             if isinstance(price_value, str):
                 try:
                     price_value = float(price_value)
                 except ValueError:
                     price_value = None
-            card = {
-                "id": prop.get("id"),
-                "name": prop.get("name"),
-                "title": prop.get("name"),
-                "subtitle": prop.get("location"),
-                "location": prop.get("location"),
+            elif not isinstance(price_value, (int, float)):
+                price_value = None
+            cards[index] = {
+                "id": prop_id,
+                "name": name,
+                "title": name,
+                "subtitle": prop_location,
+                "location": prop_location,
                 "price": price_value,
-                "amenities": prop.get("amenities", []),
-                "highlights": prop.get("highlights"),
-                "availability": prop.get("availability"),
-                "hero_image": prop.get("hero_image"),
-                "unit_types": prop.get("unit_types"),
+                "amenities": amenities or [],
+                "highlights": highlights,
+                "availability": availability,
+                "hero_image": hero_image,
+                "unit_types": unit_types,
             }
-            cards.append(card)
-            if isinstance(price_value, (int, float)):
-                summaries.append(
-                    f"{prop.get('name')} in {prop.get('location')} listed at ${price_value:,.0f}"
-                )
+            if index >= _SUMMARY_LIMIT:
+                continue
+            if price_value is None:
+                summaries.append(f"{name} in {prop_location}")
             else:
-                summaries.append(f"{prop.get('name')} in {prop.get('location')}")
-
-        await self._publish_overlay(
-            "properties.menu",
-            {
-                "items": cards,
-                "query": query,
-                "location": location,
-                "maxBudget": max_budget,
-                "filters": payload["filters"],
-                "overlayId": overlay_id,
-            },
-        )
-        await self._publish_rpc(
-            "client.properties",
-            {
-                "action": "menu",
-                "overlayId": overlay_id,
-                "items": cards,
-                "filters": payload["filters"],
-                "query": query,
-            },
+                summaries.append(f"{name} in {prop_location} listed at ${format(price_value, ',.0f')}")
+
+        # Overlay state keeps the card list; both outgoing messages embed the same pre-encoded copy.
+        encoded = {"items": json_fragment(cards)}
+        shared = {"items": cards, "query": query, "filters": payload["filters"], "overlayId": overlay_id}
+        await asyncio.gather(
+            self._publish_overlay(
+                "properties.menu", {**shared, "location": location, "maxBudget": max_budget}, encoded=encoded
+            ),
+            self._publish_rpc("client.properties", {"action": "menu", **shared}, encoded=encoded),
         )
 
         if not summaries:
             return "No matching properties were found. Offer to adjust the budget or location."
-        joined = "; ".join(summaries[:5])
+        joined = "; ".join(summaries)
         return (
             f"I found {len(cards)} option(s). Highlight a couple that fit the visitor and invite them to learn more. "
             f"Top matches: {joined}"
@@ -465,24 +783,20 @@ class EstateTools:
     async def show_property_detail(self, property_id: str, overlay_id: Optional[str] = None) -> str:
         if not property_id:
             return "Property detail not shown because no property_id was provided."
-        overlay_id = overlay_id or f"ovr-{secrets.token_hex(4)}"
-        result = await self._call_supabase_function(
-            "estate-db-query", {"property_id": property_id, "include_faq": True, "overlay_id": overlay_id}
+        overlay_id = overlay_id or self._next_overlay_id("ovr")
+        result = await self._cached_query(
+            ("detail", property_id),
+            {"property_id": property_id, "include_faq": True, "overlay_id": overlay_id},
         )
         detail = result.get("property") or result.get("data") or {}
         faqs = result.get("faqs") or detail.get("faqs")
         if not detail:
             return "Unable to load that property right now."
 
-        await self._publish_overlay("properties.detail", {"property": detail, "faqs": faqs, "overlayId": overlay_id})
-        await self._publish_rpc(
-            "client.properties",
-            {
-                "action": "detail",
-                "overlayId": overlay_id,
-                "item": detail,
-                "faqs": faqs,
-            },
+        shared = {"faqs": faqs, "overlayId": overlay_id}
+        await asyncio.gather(
+            self._publish_overlay("properties.detail", {**shared, "property": detail}),
+            self._publish_rpc("client.properties", {"action": "detail", **shared, "item": detail}),
         )
         highlights = detail.get("highlights") or ""
         price = detail.get("base_price")
@@ -509,7 +823,7 @@ class EstateTools:
         if not full_name or (not email and not phone):
             return "Lead not created. Make sure you have a name plus phone or email before calling this tool."
 
-        overlay_id = overlay_id or f"lead-{secrets.token_hex(4)}"
+        overlay_id = overlay_id or self._next_overlay_id("lead")
         payload = {
             "full_name": full_name,
             "email": email,
@@ -525,28 +839,13 @@ class EstateTools:
         result = await self._call_supabase_function("estate-crm-create-lead", payload)
         lead_id = result.get("lead_id") or result.get("id")
 
-        await self._publish_overlay(
-            "leads.created",
-            {
-                "leadId": lead_id,
-                "fullName": full_name,
-                "email": email,
-                "phone": phone,
-                "preferredLocation": preferred_location,
-                "propertyType": property_type,
-                "overlayId": overlay_id,
-            },
-        )
-        await self._publish_rpc(
-            "client.leads",
-            {
-                "action": "created",
-                "overlayId": overlay_id,
-                "leadId": lead_id,
-                "fullName": full_name,
-                "email": email,
-                "phone": phone,
-            },
+        shared = {"leadId": lead_id, "fullName": full_name, "email": email, "phone": phone, "overlayId": overlay_id}
+        await asyncio.gather(
+            self._publish_overlay(
+                "leads.created",
+                {**shared, "preferredLocation": preferred_location, "propertyType": property_type},
+            ),
+            self._publish_rpc("client.leads", {"action": "created", **shared}),
         )
         return (
             f"Lead created successfully for {full_name}. Confirm the visitor that we will follow up soon and offer a tour."
@@ -564,34 +863,19 @@ class EstateTools:
         due_at: Optional[str] = None,
         overlay_id: Optional[str] = None,
     ) -> str:
-        overlay_id = overlay_id or f"lead-{secrets.token_hex(4)}"
+        overlay_id = overlay_id or self._next_overlay_id("lead")
         payload = {
             "lead_id": lead_id,
-            "type": (activity_type or "note").lower(),
+            "type": _normalize_activity_type(activity_type),
             "message": message,
             "due_at": due_at,
         }
         payload = {key: value for key, value in payload.items() if value not in (None, "")}
-        await self._call_supabase_function("estate-crm-log-activity", payload)
-        await self._publish_overlay(
-            "leads.activity",
-            {
-                "leadId": lead_id,
-                "message": message,
-                "type": activity_type,
-                "dueAt": due_at,
-                "overlayId": overlay_id,
-            },
-        )
-        await self._publish_rpc(
-            "client.leads",
-            {
-                "action": "activity",
-                "leadId": lead_id,
-                "message": message,
-                "type": activity_type,
-                "overlayId": overlay_id,
-            },
+        self.enqueue_background_call(_ACTIVITY_FN, payload)
+        shared = {"leadId": lead_id, "message": message, "type": activity_type, "overlayId": overlay_id}
+        await asyncio.gather(
+            self._publish_overlay("leads.activity", {**shared, "dueAt": due_at}),
+            self._publish_rpc("client.leads", {"action": "activity", **shared}, reliable=False),
         )
         return "Activity captured. Let the visitor know their preference is on file."
 
@@ -605,110 +889,206 @@ class EstateTools:
         notes: Optional[str] = None,
         overlay_id: Optional[str] = None,
     ) -> str:
-        overlay_id = overlay_id or f"dir-{secrets.token_hex(4)}"
+        overlay_id = overlay_id or self._next_overlay_id("dir")
         clean_locations = locations or []
-        await self._publish_overlay(
-            "directions.show",
-            {
-                "overlayId": overlay_id,
-                "locations": clean_locations,
-                "notes": notes,
-            },
-        )
-        await self._publish_rpc(
-            "client.directions",
-            {
-                "action": "show",
-                "overlayId": overlay_id,
-                "locations": clean_locations,
-                "notes": notes,
-            },
+        shared = {"overlayId": overlay_id, "locations": clean_locations, "notes": notes}
+        await asyncio.gather(
+            self._publish_overlay("directions.show", dict(shared)),
+            self._publish_rpc("client.directions", {"action": "show", **shared}, reliable=False),
         )
         return "Shared directions with the visitor and updated the overlay."
 
 
-async def entrypoint(ctx: JobContext) -> None:
-    base_config = AgentConfig.from_env()
-    raw_metadata = None
-    try:
-        raw_metadata = getattr(ctx.job, "metadata", None)
-    except AttributeError:
-        raw_metadata = None
+async def _on_select_property(tools: EstateTools, data: Dict[str, Any], overlay_id: Optional[str]) -> None:
+    property_id = data.get("propertyId")
+    if property_id:
+        await tools.show_property_detail(str(property_id), overlay_id=overlay_id)
+
+
+async def _on_visitor_activity(
+    activity_type: str,
+    message: str,
+    tools: EstateTools,
+    data: Dict[str, Any],
+    overlay_id: Optional[str],
+) -> None:
+    await tools.log_activity(
+        lead_id=data.get("leadId"),
+        message=message,
+        activity_type=activity_type,
+        overlay_id=overlay_id,
+    )
 
-    session_overrides = _extract_session_overrides(raw_metadata)
-    if session_overrides:
-        logger.info("Session overrides received: %s", session_overrides)
 
-    config = base_config.with_session_overrides(session_overrides)
+async def _on_share_contact(tools: EstateTools, data: Dict[str, Any], overlay_id: Optional[str]) -> None:
+    full_name = data.get("fullName")
+    phone = data.get("phone")
+    email = data.get("email")
+    if full_name and (phone or email):
+        await tools.create_lead(
+            full_name=full_name,
+            phone=phone,
+            email=email,
+            summary="Visitor shared contact details from overlay CTA",
+            overlay_id=overlay_id,
+        )
+    else:
+        await tools.log_activity(
+            lead_id=data.get("leadId"),
+            message="Visitor attempted to share contact without full details",
+            activity_type="note",
+            overlay_id=overlay_id,
+        )
 
-    job_id = ctx.job.id if ctx.job else None
-    agent_identity = _clean_str(session_overrides.get("agentIdentity")) or config.agent_identity(job_id)
-    controller_identity = (
-        _clean_str(session_overrides.get("agentControllerIdentity")) or config.controller_identity(job_id)
-    )
-    visitor_name = _clean_str(session_overrides.get("visitorName"))
-    system_prompt_override = _clean_str(
-        session_overrides.get("assistantPrompt")
-        or session_overrides.get("systemPrompt")
-        or session_overrides.get("prompt")
-    )
 
-    transcript_segments: list[str] = []
-    estate_tools: Optional[EstateTools] = None  # will be assigned after room connects
-    summary_sent = False
+_EVENT_HANDLERS: Dict[str, Callable[[EstateTools, Dict[str, Any], Optional[str]], Awaitable[None]]] = {
+    "visitor.selectProperty": _on_select_property,
+    "visitor.requestTour": functools.partial(_on_visitor_activity, "tour", "Visitor requested a tour"),
+    "visitor.requestBrochure": functools.partial(_on_visitor_activity, "brochure", "Visitor requested a brochure"),
+    "visitor.shareContact": _on_share_contact,
+}
+
+
+@dataclass(slots=True)
+class SessionState:
+    """Per-room state shared by the module-level LiveKit event handlers."""
+
+    transcript_segments: deque[str]
+    estate_tools: Optional[EstateTools] = None  # assigned after the room connects
+    summary_sent: bool = False
+    background_tasks: set[asyncio.Task] = field(default_factory=set)
+
+    def spawn(self, coro: Awaitable[None]) -> None:
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
 
-    async def _submit_conversation_summary() -> None:
-        nonlocal summary_sent
-        if summary_sent:
+    def submit_conversation_summary(self) -> None:
+        """Queue the transcript for summarization once; later triggers are no-ops."""
+        if self.summary_sent:
             return
-        transcript_text = "\n".join(segment for segment in transcript_segments if segment).strip()
+        transcript_text = "\n".join(self.transcript_segments).strip()
         if not transcript_text:
             return
-        if estate_tools is None:
+        if self.estate_tools is None:
             return
-        try:
-            await estate_tools._call_supabase_function(
-                "conversation-summary",
-                {
-                    "transcript": transcript_text,
-                },
-            )
-            logger.info(
-                "Conversation transcript forwarded to summary service (%d characters)",
-                len(transcript_text),
-            )
-        except Exception as exc:  # noqa: BLE001
-            logger.exception("Failed to submit conversation summary: %s", exc)
-        finally:
-            summary_sent = True
+        self.estate_tools.enqueue_background_call("conversation-summary", {"transcript": transcript_text})
+        self.summary_sent = True
+        logger.info(
+            "Conversation transcript queued for summary service (%d characters)",
+            len(transcript_text),
+        )
+
+    async def shutdown(self) -> None:
+        # Final trigger for the summary; the disconnect handlers usually beat it and make this a no-op.
+        self.submit_conversation_summary()
+        if self.background_tasks:
+            await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        if self.estate_tools is not None:
+            await self.estate_tools.aclose()
+        await release_loop_resources()
+
+
+def _parse_transcription(data: Any, topic: Optional[str]) -> Optional[str]:
+    """Return the trimmed text of a final transcription frame, or None for anything else."""
+    # Reject non-transcription and interim frames before decoding anything.
+    if (topic or getattr(data, "topic", None)) != _LK_TRANSCRIPTION_TOPIC:
+        return None
+    attributes = getattr(data, "attributes", None) or _EMPTY_ATTRS
+    if attributes.get("lk.transcription_final") in _NON_FINAL_FLAGS:
+        return None
+    message = getattr(data, "message", data)
+    if type(message) is not str:  # common case first: a plain str needs no conversion
+        if isinstance(message, (bytes, bytearray)):
+            message = message.decode("utf-8", errors="ignore")
+        else:
+            message = str(message)
+    return message.strip() or None
+
+
+def _on_text_received(state: SessionState, *args, **kwargs) -> None:  # noqa: ANN002, ANN003
+    try:
+        match args, kwargs:
+            case (_, {"data": data, **rest}):
+                topic = rest.get("topic")
+            case ((_, data, topic, *_), _):
+                pass
+            case ((_, data), _):
+                topic = kwargs.get("topic")
+            case _:
+                return
+        segment = _parse_transcription(data, topic)
+        if segment:
+            state.transcript_segments.append(segment)
+    except Exception as exc:  # noqa: BLE001
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Failed to capture transcription payload: %s", exc)
 
+
+def _on_data_received(state: SessionState, payload, participant, kind, topic) -> None:  # noqa: ANN001
+    estate_tools = state.estate_tools
+    if estate_tools is None:
+        return
+    try:
+        message = loads(payload)
+    except Exception:  # noqa: BLE001
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Failed to decode data payload from %s", getattr(participant, "identity", "unknown"))
+        return
+
+    if not isinstance(message, dict):
+        return
+    event_type = message.get("type") or topic or ""
+    handler = _EVENT_HANDLERS.get(event_type)
+    if handler is None and event_type != "agent.overlayAck":
+        return
+    data = message.get("payload")
+    if not isinstance(data, dict):
+        data = {}
+    overlay_id = data.get("overlayId")
+
+    if handler is None:
+        estate_tools.register_ack(overlay_id)
+        return
+    state.spawn(handler(estate_tools, data, overlay_id))
+
+
+def _on_participant_disconnected(state: SessionState, participant) -> None:  # noqa: ANN001
+    identity = getattr(participant, "identity", "") or ""
+    if identity.startswith("Visitor"):
+        state.submit_conversation_summary()
+
+
+def _on_room_closed(state: SessionState, _reason) -> None:  # noqa: ANN001
+    state.submit_conversation_summary()
+
+
+def _on_track_subscribed(track, publication, participant) -> None:  # noqa: ANN001
     logger.info(
-        "Connecting to LiveKit (%s) as controller %s for agent %s",
-        config.livekit_url,
-        controller_identity,
-        agent_identity,
+        "Track subscribed: participant=%s track_sid=%s kind=%s source=%s",
+        getattr(participant, "identity", "<unknown>"),
+        getattr(publication, "track_sid", None),
+        getattr(track, "kind", None),
+        getattr(publication, "source", None),
     )
-    await ctx.connect()
-    await ctx.wait_for_participant()
-    logger.info("Participant joined. Starting avatar session as %s", agent_identity)
 
-    stt = deepgram.STT(model="nova-3", api_key=config.deepgram_api_key)
-    vad = silero.VAD.load()
-    llm = google.LLM(
-        model=config.google_model,
-        api_key=config.google_api_key,
-    )
-    tts = cartesia.TTS(
-        model="sonic-3",
-        voice=config.cartesia_voice_id,
-        api_key=config.cartesia_api_key,
-    )
+
+async def _start_avatar_session(
+    config: AgentConfig,
+    room: Any,
+    components_task: "asyncio.Task[Any]",
+    agent_identity: str,
+) -> AgentSession:
+    stt, vad, llm, tts = await components_task
 
     session = AgentSession(
         stt=stt,
         vad=vad,
         llm=llm,
         tts=tts,
+        turn_detection="stt",
+        min_endpointing_delay=0.3,
+        preemptive_generation=True,
     )
 
     avatar_session = anam_avatar.AvatarSession(
@@ -726,113 +1106,85 @@ async def entrypoint(ctx: JobContext) -> None:
             config.anam_avatar_id or "<default>",
             agent_identity,
         )
-        await avatar_session.start(session, room=ctx.room)
+        await avatar_session.start(session, room=room)
         logger.info("Anam avatar session started successfully")
     except Exception as exc:  # noqa: BLE001
         logger.exception("Failed to start Anam avatar session: %s", exc)
         raise
+    return session
 
-    estate_tools = EstateTools(config, ctx.room)
 
-    @ctx.room.on("text_received")
-    def _on_text_received(*args, **kwargs):  # noqa: ANN001
-        try:
-            if "data" in kwargs:
-                data = kwargs["data"]
-                topic = kwargs.get("topic")
-            elif len(args) >= 2:
-                data = args[1]
-                topic = args[2] if len(args) >= 3 else kwargs.get("topic")
-            else:
-                return
-            message = getattr(data, "message", data)
-            if isinstance(message, (bytes, bytearray)):
-                message = message.decode("utf-8", errors="ignore")
-            if not isinstance(message, str):
-                message = str(message)
-            attributes = getattr(data, "attributes", {}) or {}
-            topic_name = topic or getattr(data, "topic", None)
-            if topic_name != "lk.transcription":
-                return
-            final_flag = attributes.get("lk.transcription_final")
-            if final_flag in {"false", "0", False}:
-                return
-            trimmed = message.strip()
-            if trimmed:
-                transcript_segments.append(trimmed)
-        except Exception as exc:  # noqa: BLE001
-            logger.debug("Failed to capture transcription payload: %s", exc)
+async def entrypoint(ctx: JobContext) -> None:
+    base_config = _base_config()
+    raw_metadata = None
+    try:
+        raw_metadata = getattr(ctx.job, "metadata", None)
+    except AttributeError:
+        raw_metadata = None
 
-    @ctx.room.on("data_received")
-    def _on_data_received(payload, participant, kind, topic):  # noqa: ANN001
-        if estate_tools is None:
-            return
-        try:
-            decoded = payload.decode("utf-8")
-            message = json.loads(decoded)
-        except Exception:  # noqa: BLE001
-            logger.debug("Failed to decode data payload from %s", getattr(participant, "identity", "unknown"))
-            return
+    overrides = SessionOverrides.from_raw(_extract_session_overrides(raw_metadata))
+    session_overrides = overrides.raw
+    if session_overrides:
+        logger.info("Session overrides received: %s", session_overrides)
+
+    config = base_config.with_session_overrides(session_overrides)
+
+    job_id = ctx.job.id if ctx.job else None
+    agent_identity = overrides.agent_identity or config.agent_identity(job_id)
+    controller_identity = overrides.controller_identity or config.controller_identity(job_id)
+    visitor_name = overrides.visitor_name
+    system_prompt_override = overrides.system_prompt
+
+    state = SessionState(transcript_segments=deque(maxlen=config.max_transcript_segments))
 
-        event_type = message.get("type") or topic or ""
-        data = message.get("payload") or {}
-        overlay_id = data.get("overlayId") if isinstance(data, dict) else None
+    logger.info(
+        "Connecting to LiveKit (%s) as controller %s for agent %s",
+        config.livekit_url,
+        controller_identity,
+        agent_identity,
+    )
+    acquire_loop_resources()
+    ctx.add_shutdown_callback(state.shutdown)
+    components_task = asyncio.create_task(_load_session_components(config))
+    try:
+        await ctx.connect()
+    except BaseException:
+        components_task.cancel()
+        raise
 
-        if event_type == "agent.overlayAck":
-            estate_tools.register_ack(overlay_id)
+    # The avatar joins as its own participant, so its handshake can run while we wait for the visitor.
+    # The wait is bounded because the avatar is billed from the moment it starts.
+    participant_task = asyncio.create_task(
+        asyncio.wait_for(ctx.wait_for_participant(), timeout=_PARTICIPANT_WAIT_TIMEOUT)
+    )
+    avatar_task = asyncio.create_task(_start_avatar_session(config, ctx.room, components_task, agent_identity))
+    try:
+        await asyncio.gather(participant_task, avatar_task)
+    except BaseException:
+        # gather leaves the sibling running when one side fails; stop it so neither outlives the job.
+        participant_task.cancel()
+        avatar_task.cancel()
+        if (
+            participant_task.done()
+            and not participant_task.cancelled()
+            and isinstance(participant_task.exception(), asyncio.TimeoutError)
+        ):
+            logger.warning("No visitor joined within %ss; shutting down", _PARTICIPANT_WAIT_TIMEOUT)
+            ctx.shutdown(reason="visitor never joined")
             return
+        raise
+    session = avatar_task.result()
+    logger.info("Participant joined; avatar session ready as %s", agent_identity)
+
+    estate_tools = EstateTools(config, ctx.room)
+    state.estate_tools = estate_tools
 
-        async def _handle() -> None:
-            if event_type == "visitor.selectProperty":
-                property_id = data.get("propertyId") if isinstance(data, dict) else None
-                if property_id:
-                    await estate_tools.show_property_detail(str(property_id), overlay_id=overlay_id)
-            elif event_type == "visitor.requestTour":
-                await estate_tools.log_activity(
-                    lead_id=data.get("leadId") if isinstance(data, dict) else None,
-                    message="Visitor requested a tour",
-                    activity_type="tour",
-                    overlay_id=overlay_id,
-                )
-            elif event_type == "visitor.requestBrochure":
-                await estate_tools.log_activity(
-                    lead_id=data.get("leadId") if isinstance(data, dict) else None,
-                    message="Visitor requested a brochure",
-                    activity_type="brochure",
-                    overlay_id=overlay_id,
-                )
-            elif event_type == "visitor.shareContact":
-                payload_data = data if isinstance(data, dict) else {}
-                full_name = payload_data.get("fullName")
-                phone = payload_data.get("phone")
-                email = payload_data.get("email")
-                if full_name and (phone or email):
-                    await estate_tools.create_lead(
-                        full_name=full_name,
-                        phone=phone,
-                        email=email,
-                        summary="Visitor shared contact details from overlay CTA",
-                        overlay_id=overlay_id,
-                    )
-                else:
-                    await estate_tools.log_activity(
-                        lead_id=payload_data.get("leadId"),
-                        message="Visitor attempted to share contact without full details",
-                        activity_type="note",
-                        overlay_id=overlay_id,
-                    )
-
-        asyncio.create_task(_handle())
-
-    @ctx.room.on("participant_disconnected")
-    def _on_participant_disconnected(participant):  # noqa: ANN001
-        identity = getattr(participant, "identity", "") or ""
-        if identity.startswith("Visitor"):
-            asyncio.create_task(_submit_conversation_summary())
-
-    @ctx.room.on("disconnected")
-    def _on_room_closed(_reason):  # noqa: ANN001
-        asyncio.create_task(_submit_conversation_summary())
+    ctx.room.on("data_received", functools.partial(_on_data_received, state))
+    if config.capture_transcripts:
+        # Transcription frames arrive many times per second; skip the handlers entirely when summaries are off.
+        ctx.room.on("text_received", functools.partial(_on_text_received, state))
+        ctx.room.on("participant_disconnected", functools.partial(_on_participant_disconnected, state))
+        ctx.room.on("disconnected", functools.partial(_on_room_closed, state))
 
     instructions_source = system_prompt_override or DEFAULT_PROMPT or FALLBACK_PROMPT
     instructions = build_agent_instructions(instructions_source, config, session_overrides)
@@ -841,7 +1193,7 @@ async def entrypoint(ctx: JobContext) -> None:
         "linkConfig": session_overrides,
         "room": getattr(ctx.room, "name", None),
     }
-    instructions = f"{instructions}\n\n[SESSION_CONTEXT]\n{json.dumps(session_context, default=str)}\n"
+    instructions = "".join((instructions, _SESSION_CONTEXT_HEADER, dumps_str(session_context), "\n"))
 
     logger.info(
         "Configured session with gemini=%s cartesia_voice=%s avatar=%s",
@@ -850,79 +1202,67 @@ async def entrypoint(ctx: JobContext) -> None:
         config.anam_avatar_id or "<default>",
     )
 
-    try:
-        agent = Agent(
-            instructions=instructions,
-            tools=[
-                estate_tools.list_properties,
-                estate_tools.show_property_detail,
-                estate_tools.create_lead,
-                estate_tools.log_activity,
-                estate_tools.show_directions,
-            ],
-        )
+    agent = Agent(
+        instructions=instructions,
+        tools=[
+            estate_tools.list_properties,
+            estate_tools.show_property_detail,
+            estate_tools.create_lead,
+            estate_tools.log_activity,
+            estate_tools.show_directions,
+        ],
+    )
 
-        await session.start(
-            agent=agent,
-            room=ctx.room,
-            room_input_options=RoomInputOptions(audio_enabled=True, video_enabled=False, close_on_disconnect=False),
-        )
-        logger.info("Agent session started; awaiting realtime events")
-
-        @ctx.room.on("track_subscribed")
-        def _on_track_subscribed(track, publication, participant):  # noqa: ANN001
-            logger.info(
-                "Track subscribed: participant=%s track_sid=%s kind=%s source=%s",
-                getattr(participant, "identity", "<unknown>"),
-                getattr(publication, "track_sid", None),
-                getattr(track, "kind", None),
-                getattr(publication, "source", None),
-            )
+    await session.start(
+        agent=agent,
+        room=ctx.room,
+        room_input_options=RoomInputOptions(audio_enabled=True, video_enabled=False, close_on_disconnect=False),
+    )
+    logger.info("Agent session started; awaiting realtime events")
 
+    ctx.room.on("track_subscribed", _on_track_subscribed)
+
+    opening_prompt = (
+        "Greet the visitor to Estate Buddy, ask what they are looking for, and offer to recommend properties."
+    )
+    if visitor_name:
         opening_prompt = (
-            "Greet the visitor to Estate Buddy, ask what they are looking for, and offer to recommend properties."
+            f"Greet {visitor_name} and welcome them to Estate Buddy. Ask what they are looking for and offer to recommend properties."
         )
-        if visitor_name:
-            opening_prompt = (
-                f"Greet {visitor_name} and welcome them to Estate Buddy. Ask what they are looking for and offer to recommend properties."
-            )
 
-        await session.generate_reply(instructions=opening_prompt)
-    finally:
-        await _submit_conversation_summary()
+    await session.generate_reply(instructions=opening_prompt)
 
 
 async def request_fnc(req: JobRequest) -> None:
-    base_config = AgentConfig.from_env()
+    base_config = _base_config()
     raw_metadata = getattr(req, "metadata", None)
-    session_overrides = _extract_session_overrides(raw_metadata)
+    overrides = SessionOverrides.from_raw(_extract_session_overrides(raw_metadata))
+    session_overrides = overrides.raw
     if session_overrides:
         logger.info("Dispatch overrides received: %s", session_overrides)
     config = base_config.with_session_overrides(session_overrides)
 
-    agent_identity = _clean_str(session_overrides.get("agentIdentity")) or config.agent_identity(req.id)
-    controller_identity = (
-        _clean_str(session_overrides.get("agentControllerIdentity")) or config.controller_identity(req.id)
-    )
+    agent_identity = overrides.agent_identity or config.agent_identity(req.id)
+    controller_identity = overrides.controller_identity or config.controller_identity(req.id)
 
     metadata_payload = config.agent_metadata(agent_identity)
-    if session_overrides:
-        metadata_payload["sessionOverrides"] = session_overrides
-
     attributes = {
         "agentIdentity": agent_identity,
         "agentControllerIdentity": controller_identity,
         "agentName": config.agent_name,
     }
     if session_overrides:
-        attributes["sessionOverrides"] = json.dumps(session_overrides)
+        # Encode once; the metadata embeds the same bytes the attribute carries.
+        overrides_json = json_fragment(session_overrides, sort_keys=True)
+        metadata_payload["sessionOverrides"] = overrides_json
+        attributes["sessionOverrides"] = dumps_str(overrides_json)
 
-    display_name = _clean_str(session_overrides.get("agentName")) or config.agent_name
+    display_name = overrides.agent_name or config.agent_name
 
     await req.accept(
         name=display_name,
         identity=controller_identity,
-        metadata=json.dumps(metadata_payload),
+        metadata=dumps_str(metadata_payload),
         attributes=attributes,
     )
     logger.info(
@@ -934,7 +1274,7 @@ async def request_fnc(req: JobRequest) -> None:
 
 
 def main() -> None:
-    config = AgentConfig.from_env()
+    config = _base_config()
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
@@ -7,20 +7,21 @@ Reuses Supabase-backed tools (lead creation, activity logging, stage updates).
 
 from __future__ import annotations
 
-import json
+import asyncio
+import functools
 import logging
 import os
-import secrets
+import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Awaitable, Dict, Optional
 
-import httpx
 from dotenv import load_dotenv
 from livekit.agents import (
     Agent,
     AgentSession,
     JobContext,
+    JobProcess,
     JobRequest,
     RunContext,
     WorkerOptions,
@@ -31,6 +32,17 @@ from livekit.agents.llm import function_tool
 from livekit.agents.voice.room_io import RoomInputOptions
 from livekit.plugins import google, deepgram, cartesia, silero
 
+from _supabase_http import (
+    acquire_loop_resources,
+    dumps,
+    dumps_str,
+    fallback_identity_suffix,
+    get_http_client,
+    loads,
+    loop_resources,
+    release_loop_resources,
+)
+
 logger = logging.getLogger("outbound-caller-agent")
 logger.setLevel(logging.INFO)
 load_dotenv(dotenv_path=Path(__file__).resolve().with_name("secreat.env"))
@@ -57,8 +69,31 @@ Flow:
 5) Summarize and close.
 """
 
+# Activities logged within this window are sent to the CRM in one request.
+_ACTIVITY_FN = "estate-crm-log-activity"
+_ACTIVITY_BATCH_WINDOW = 0.05
+
+# activities.type is constrained to these values; map the model's likely phrasings onto them.
+_ACTIVITY_TYPES = frozenset(("note", "task", "status"))
+_ACTIVITY_TYPE_ALIASES = {
+    "call": "note",
+    "voicemail": "note",
+    "follow_up": "task",
+    "follow-up": "task",
+    "followup": "task",
+    "callback": "task",
+    "stage": "status",
+}
+
+# Cheap sanity checks so obviously garbled contact details never cost a CRM round-trip.
+_EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+_PHONE_RE = re.compile(r"\+?[0-9()\-.\s]{7,20}")
+
+# Static part of every job's instructions; only the session context JSON is appended per call.
+_PROMPT_PREFIX = f"{OUTBOUND_PROMPT}\n\n[SESSION_CONTEXT]\n"
+
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AgentConfig:
     livekit_url: str
     livekit_api_key: str
@@ -93,7 +128,7 @@ class AgentConfig:
         )
 
     def agent_identity(self, job_id: Optional[str]) -> str:
-        return f"{self.agent_identity_prefix}:{job_id or secrets.token_hex(4)}"
+        return f"{self.agent_identity_prefix}:{job_id or fallback_identity_suffix()}"
 
     def agent_metadata(self, agent_identity: str) -> Dict[str, Any]:
         return {
@@ -106,21 +141,85 @@ class AgentConfig:
         }
 
 
+@functools.lru_cache(maxsize=1)
+def _base_config() -> AgentConfig:
+    """Read the environment once per process."""
+    return AgentConfig.from_env()
+
+
+def _log_task_failure(label: str, task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background %s failed: %s", label, task.exception())
+
+
 class OutboundTools:
     def __init__(self, config: AgentConfig, room: Optional[RunContext]):
         self.config = config
         self.room = room
-
-    async def _call_supabase_function(self, fn_name: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-        headers = {
+        base_url = config.supabase_url.rstrip("/")
+        api_key = config.supabase_service_role_key or config.supabase_anon_key
+        self._functions_url = f"{base_url}/functions/v1/"
+        self._leads_url = f"{base_url}/rest/v1/leads"
+        self._auth_headers = {
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.config.supabase_service_role_key or self.config.supabase_anon_key}",
+            "Authorization": f"Bearer {api_key}",
+        }
+        self._patch_headers = {
+            **self._auth_headers,
+            "apikey": api_key,
+            # The updated row is never read, so let PostgREST answer 204 with no body.
+            "Prefer": "return=minimal",
         }
-        url = f"{self.config.supabase_url.rstrip('/')}/functions/v1/{fn_name}"
-        async with httpx.AsyncClient(timeout=httpx.Timeout(20.0, read=20.0)) as client:
-            response = await client.post(url, json=payload, headers=headers)
+        self._background_tasks: set[asyncio.Task] = set()
+        self._pending_activities: list[Dict[str, Any]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def _spawn(self, coro: Awaitable[Any], label: str) -> None:
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        task.add_done_callback(functools.partial(_log_task_failure, label))
+
+    def _queue_activity(self, payload: Dict[str, Any]) -> None:
+        self._pending_activities.append(payload)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                _ACTIVITY_BATCH_WINDOW, self._flush_activities
+            )
+
+    def _flush_activities(self) -> None:
+        self._flush_handle = None
+        batch, self._pending_activities = self._pending_activities, []
+        if not batch:
+            return
+        # A lone activity keeps the original single-object body.
+        body = batch[0] if len(batch) == 1 else {"activities": batch}
+        self._spawn(self._post_activities(body), "activity log")
+
+    async def _post_activities(self, body: Dict[str, Any]) -> None:
+        result = await self._call_supabase_function(_ACTIVITY_FN, body, parse="activities" in body)
+        if result.get("failures"):
+            logger.warning("%s rejected %d row(s): %s", _ACTIVITY_FN, len(result["failures"]), result["failures"])
+
+    async def aclose(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_activities()
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
+    async def _call_supabase_function(
+        self, fn_name: str, payload: Dict[str, Any], parse: bool = False
+    ) -> Dict[str, Any]:
+        """POST to a Supabase edge function; the JSON body is only decoded when ``parse`` is set."""
+        async with loop_resources().semaphore:
+            response = await get_http_client().post(
+                self._functions_url + fn_name, content=dumps(payload), headers=self._auth_headers
+            )
         response.raise_for_status()
-        data = response.json()
+        if not parse:
+            return {}
+        data = loads(response.content)
         return data if isinstance(data, dict) else {"data": data}
 
     @function_tool(
@@ -138,6 +237,12 @@ class OutboundTools:
         intent_level: Optional[str] = None,
         summary: Optional[str] = None,
     ) -> str:
+        email = email.strip() if email else None
+        phone = phone.strip() if phone else None
+        if email and not _EMAIL_RE.fullmatch(email):
+            return "Lead not created. The email address doesn't look valid; ask the caller to spell it again."
+        if phone and not _PHONE_RE.fullmatch(phone):
+            return "Lead not created. The phone number doesn't look valid; ask the caller to repeat it."
         payload = {
             "full_name": full_name,
             "phone": phone,
@@ -148,6 +253,7 @@ class OutboundTools:
             "intent_level": intent_level,
             "summary": summary,
         }
+        payload = {key: value for key, value in payload.items() if value not in (None, "")}
         await self._call_supabase_function("estate-crm-create-lead", payload)
         return "Lead created or updated."
 
@@ -159,16 +265,23 @@ class OutboundTools:
         self,
         lead_id: Optional[str],
         message: str,
-        activity_type: str = "call",
+        activity_type: str = "note",
         due_at: Optional[str] = None,
     ) -> str:
+        kind = (activity_type or "note").strip().lower()
+        kind = _ACTIVITY_TYPE_ALIASES.get(kind, kind)
+        if kind not in _ACTIVITY_TYPES:
+            return "Activity not logged. Use activity_type note, task or status."
+        if not message or not message.strip():
+            return "Activity not logged. Provide a short message describing the activity."
         payload = {
             "lead_id": lead_id,
             "message": message,
-            "activity_type": activity_type,
+            "type": kind,
             "due_at": due_at,
         }
-        await self._call_supabase_function("estate-crm-log-activity", payload)
+        payload = {key: value for key, value in payload.items() if value not in (None, "")}
+        self._queue_activity(payload)
         return "Activity logged."
 
     @function_tool(
@@ -181,33 +294,43 @@ class OutboundTools:
         stage: str,
         note: Optional[str] = None,
     ) -> str:
-        url = f"{self.config.supabase_url.rstrip('/')}/rest/v1/leads"
-        headers = {
-            "apikey": self.config.supabase_service_role_key or self.config.supabase_anon_key,
-            "Authorization": f"Bearer {self.config.supabase_service_role_key or self.config.supabase_anon_key}",
-            "Content-Type": "application/json",
-            "Prefer": "return=representation",
-        }
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            resp = await client.patch(
-                url,
+        async with loop_resources().semaphore:
+            resp = await get_http_client().patch(
+                self._leads_url,
                 params={"id": f"eq.{lead_id}"},
-                json={"stage": stage.lower()},
-                headers=headers,
+                content=dumps({"stage": stage.lower()}),
+                headers=self._patch_headers,
             )
         resp.raise_for_status()
         if note:
+            # log_activity only validates and queues the note; the write goes out with the next batch flush.
             await self.log_activity(lead_id=lead_id, message=note, activity_type="note")
         return f"Stage updated to {stage}"
 
 
+def _use_uvloop() -> None:
+    """Make event loops created from here on use uvloop, when it is installed."""
+    try:
+        import uvloop
+    except ImportError:  # pragma: no cover - e.g. Windows
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+def prewarm(proc: JobProcess) -> None:
+    """Load the Silero model once per worker process instead of on every call."""
+    # Job processes build their own loop after prewarm returns, so this is where jobs pick up uvloop.
+    _use_uvloop()
+    proc.userdata["vad"] = silero.VAD.load()
+
+
 async def entrypoint(ctx: JobContext) -> None:
-    config = AgentConfig.from_env()
+    config = _base_config()
     raw_metadata = getattr(ctx.job, "metadata", None)
     session_overrides: Dict[str, Any] = {}
     if raw_metadata:
         try:
-            session_overrides = json.loads(raw_metadata) if isinstance(raw_metadata, str) else raw_metadata
+            session_overrides = loads(raw_metadata) if isinstance(raw_metadata, str) else raw_metadata
         except Exception:
             logger.warning("Failed to parse job metadata: %s", raw_metadata)
             session_overrides = {}
@@ -219,7 +342,7 @@ async def entrypoint(ctx: JobContext) -> None:
     await ctx.wait_for_participant()
 
     stt = deepgram.STT(model="nova-3", api_key=config.deepgram_api_key)
-    vad = silero.VAD.load()
+    vad = ctx.proc.userdata.get("vad") or silero.VAD.load()
     llm = google.LLM(model=config.google_model, api_key=config.google_api_key)
     tts = cartesia.TTS(model="sonic-3", voice=config.cartesia_voice_id, api_key=config.cartesia_api_key)
 
@@ -231,6 +354,15 @@ async def entrypoint(ctx: JobContext) -> None:
     )
 
     tools = OutboundTools(config, ctx.room)
+    acquire_loop_resources()
+
+    async def _shutdown() -> None:
+        # Drain pending writes before closing the client they use.
+        await tools.aclose()
+        await release_loop_resources()
+
+    ctx.add_shutdown_callback(_shutdown)
+
     session_context = {
         "lead_id": session_overrides.get("lead_id"),
         "submission_id": session_overrides.get("submission_id"),
@@ -242,7 +374,7 @@ async def entrypoint(ctx: JobContext) -> None:
         "location": session_overrides.get("location"),
         "notes": session_overrides.get("notes"),
     }
-    instructions = f"{OUTBOUND_PROMPT}\n\n[SESSION_CONTEXT]\n{json.dumps(session_context)}"
+    instructions = _PROMPT_PREFIX + dumps_str(session_context)
 
     # Add metadata into logs for tracing
     ctx.log_context_fields = {
@@ -270,20 +402,23 @@ async def entrypoint(ctx: JobContext) -> None:
 
 
 async def request_fnc(req: JobRequest) -> None:
-    config = AgentConfig.from_env()
-    metadata_payload = config.agent_metadata(config.agent_identity(req.id))
+    config = _base_config()
+    agent_identity = config.agent_identity(req.id)
+    metadata_payload = config.agent_metadata(agent_identity)
     await req.accept(
         name=config.agent_name,
-        identity=config.agent_identity(req.id),
-        metadata=json.dumps(metadata_payload),
+        identity=agent_identity,
+        metadata=dumps_str(metadata_payload),
     )
 
 
 def main() -> None:
-    cfg = AgentConfig.from_env()
+    _use_uvloop()
+    cfg = _base_config()
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
             worker_type=WorkerType.ROOM,
             request_fnc=request_fnc,
             agent_name=cfg.agent_name,
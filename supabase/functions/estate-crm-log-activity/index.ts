@@ -6,6 +6,8 @@ const corsHeaders = {
   'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Client-Info, Apikey',
 };
 
+const ACTIVITY_TYPES = new Set(['note', 'task', 'status']);
+
 Deno.serve(async (req: Request) => {
   if (req.method === 'OPTIONS') {
     return new Response(null, { status: 200, headers: corsHeaders });
@@ -16,19 +18,60 @@ Deno.serve(async (req: Request) => {
     const supabaseKey = Deno.env.get('SUPABASE_SERVICE_ROLE_KEY')!;
     const supabase = createClient(supabaseUrl, supabaseKey);
 
-    const { lead_id, type, message, due_at } = await req.json();
+    const body = await req.json();
+    // Agents batch bursts of activities as { activities: [...] }; a bare object is a single activity.
+    const isBatch = Array.isArray(body?.activities);
+    const entries: any[] = isBatch ? body.activities : [body];
 
-    const { error } = await supabase
-      .from('activities')
-      .insert({
-        lead_id,
-        type,
-        message,
-        due_at: due_at || null,
-        created_by: null,
+    const rows: { index: number; row: Record<string, unknown> }[] = [];
+    const failures: { index: number; error: string }[] = [];
+    entries.forEach((entry, index) => {
+      const { lead_id, type, message, due_at } = entry ?? {};
+      if (!ACTIVITY_TYPES.has(type)) {
+        failures.push({ index, error: `invalid activity type: ${type}` });
+        return;
+      }
+      if (typeof message !== 'string' || !message.trim()) {
+        failures.push({ index, error: 'activity message is required' });
+        return;
+      }
+      rows.push({
+        index,
+        row: {
+          lead_id,
+          type,
+          message,
+          due_at: due_at || null,
+          created_by: null,
+        },
       });
+    });
+
+    if (rows.length) {
+      const { error } = await supabase.from('activities').insert(rows.map(({ row }) => row));
+      if (error) {
+        if (!isBatch) throw error;
+        // One bad row (e.g. an unknown lead_id) fails the whole statement; retry rows individually
+        // so the valid ones in the batch still land.
+        for (const { index, row } of rows) {
+          const { error: rowError } = await supabase.from('activities').insert(row);
+          if (rowError) failures.push({ index, error: rowError.message });
+        }
+      }
+    }
 
-    if (error) throw error;
+    if (!isBatch && failures.length) {
+      return new Response(
+        JSON.stringify({ error: failures[0].error }),
+        { status: 400, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
+    if (isBatch) {
+      return new Response(
+        JSON.stringify({ ok: failures.length === 0, inserted: entries.length - failures.length, failures }),
+        { headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
 
     return new Response(
       JSON.stringify({ ok: true }),